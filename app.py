@@ -4,6 +4,9 @@ import pandas as pd
 # from src.utils import load_config, get_credentials
 # from src.crawler import TradeDataCrawler
 # from src.preprocessor import DataPreprocessor
+# from src.exporter import ExportBundler
+# from src.pipeline import CrawlPipeline
+# import os
 
 # def main():
 #     st.set_page_config(page_title="Trade Crawler Pro", layout="wide")
@@ -37,83 +40,62 @@ import pandas as pd
 #         # Lấy giới hạn dòng mỗi file từ config. Mặc định 50,000 dòng.
 #         MAX_ROWS_PER_FILE = config['processing'].get('max_rows_per_file', 50000)
         
-#         buffer = []          # Cái xô chứa dữ liệu tạm
-#         file_results = []    # Danh sách các file đã tạo xong
 #         total_fetched = 0    # Tổng số dòng đã crawl được từ đầu
-#         part_index = 1       # Đếm số thứ tự file (part_1, part_2...)
 
-#         # Gọi hàm Generator (Streaming)
-#         data_gen = crawler.fetch_data_generator(start_date, end_date, company_name, hs_code)
+#         # Gom tất cả các part vào 1 file ZIP trên ổ đĩa (ghi dần trong lúc crawl)
+#         bundler = ExportBundler(config)
 
-#         try:
-#             # Vòng lặp lấy từng trang data về
-#             for page_data in data_gen:
-#                 if not page_data: 
-#                     continue
-
-#                 # 1. Đổ data vào xô
-#                 buffer.extend(page_data)
-#                 total_fetched += len(page_data)
-
-#                 # Hiển thị trạng thái realtime
-#                 status_box.info(
-#                     f"🔄 Đang crawl... Tổng: **{total_fetched}** dòng. "
-#                     f"Đang chờ đóng gói: **{len(buffer)}/{MAX_ROWS_PER_FILE}** dòng (File Part {part_index})"
-#                 )
+#         # Pipeline: crawl -> chuẩn hóa -> ghi file, mỗi bước chạy song song trong thread riêng.
+#         # (nhiều công ty / HS code phân cách bởi ';' sẽ được chia thành các sub-query chạy song song)
+#         pipeline = CrawlPipeline(config, crawler, processor, bundler)
 
-#                 # 2. Kiểm tra: Nếu xô đầy tràn -> Cắt ra làm file
-#                 while len(buffer) >= MAX_ROWS_PER_FILE:
-#                     # Cắt đúng số lượng quy định
-#                     chunk_to_save = buffer[:MAX_ROWS_PER_FILE]
-                    
-#                     # Phần dư giữ lại trong xô cho đợt sau
-#                     buffer = buffer[MAX_ROWS_PER_FILE:] 
-                    
-#                     # Tạo file Excel
-#                     file_name = f"trade_data_part_{part_index}.xlsx"
-#                     status_box.warning(f"💾 Đang tạo file **{file_name}**...")
-                    
-#                     excel_bytes = processor.create_excel_bytes(pd.DataFrame(chunk_to_save))
-                    
-#                     if excel_bytes:
-#                         file_results.append({'name': file_name, 'data': excel_bytes})
-#                         part_index += 1 # Tăng số thứ tự file tiếp theo
-
-#             # 3. XỬ LÝ PHẦN CÒN LẠI (LEFTOVER)
-#             # Sau khi crawl xong hết, nếu trong xô vẫn còn ít dữ liệu chưa đủ 50k
-#             if buffer:
-#                 file_name = f"trade_data_part_{part_index}.xlsx"
-#                 status_box.warning(f"💾 Đang tạo file cuối cùng **{file_name}**...")
-#                 excel_bytes = processor.create_excel_bytes(pd.DataFrame(buffer))
-#                 if excel_bytes:
-#                     file_results.append({'name': file_name, 'data': excel_bytes})
+#         try:
+#             # Mỗi event là 1 cập nhật tiến độ từ các stage -> hiển thị trạng thái realtime
+#             for event in pipeline.run(start_date, end_date, company_name, hs_code):
+#                 if event['stage'] == 'crawl':
+#                     total_fetched = event['total_fetched']
+#                     status_box.info(f"🔄 Đang crawl... Tổng: **{total_fetched}** dòng.")
+#                 elif event['stage'] == 'process':
+#                     status_box.info(
+#                         f"🔄 Đang crawl... Tổng: **{total_fetched}** dòng. "
+#                         f"Đang chờ đóng gói: **{event['buffered']}/{MAX_ROWS_PER_FILE}** dòng (File Part {event['part_index']})"
+#                     )
+#                 elif event['stage'] == 'write' and 'rows' in event:
+#                     status_box.warning(f"💾 Đang tạo file **{event['file_name']}**...")
 
 #             # --- KẾT THÚC ---
-#             status_box.success(f"✅ Hoàn thành! Tổng cộng: {total_fetched} dòng. Đã chia thành {len(file_results)} file.")
+#             zip_path = bundler.close()
+#             status_box.success(
+#                 f"✅ Hoàn thành! Tổng cộng: {total_fetched} dòng. "
+#                 f"Đã đóng gói {len(bundler.parts)} file vào **{os.path.basename(zip_path)}**."
+#             )
 
-#             # Hiển thị nút download
-#             st.write("### 📂 Danh sách file tải xuống:")
-            
-#             # Chia cột hiển thị cho đẹp
-#             cols = st.columns(3)
-#             for i, f in enumerate(file_results):
-#                 with cols[i % 3]:
-#                     st.download_button(
-#                         label=f"📥 Tải {f['name']}",
-#                         data=f['data'],
-#                         file_name=f['name'],
-#                         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-#                         key=f"dl_{i}"
-#                     )
+#             # Chỉ 1 nút download: đọc file ZIP từ ổ đĩa
+#             with open(zip_path, "rb") as f:
+#                 st.download_button(
+#                     label=f"📥 Tải {os.path.basename(zip_path)}",
+#                     data=f,
+#                     file_name=os.path.basename(zip_path),
+#                     mime="application/zip",
+#                     key="dl_bundle"
+#                 )
 
 #         except Exception as e:
 #             st.error(f"Lỗi trong quá trình xử lý: {e}")
+#         finally:
+#             bundler.close()
 
 # if __name__ == "__main__":
 #     main()
+import os
 import time
+import yaml
 from io import BytesIO
 from processor import standardize_data, filter_by_product
+from session_store import LogBuffer, DatasetRegistry
+
+# Resolved from this file, so the app works no matter which directory it is launched from
+SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "settings.yaml")
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -173,15 +155,32 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# --- Shared Resources (one instance per server, shared by all sessions) ---
+@st.cache_resource
+def get_dataset_registry():
+    return DatasetRegistry()
+
+@st.cache_data(show_spinner=False)
+def get_ui_config():
+    """UI settings from config/settings.yaml, read once per server. Falls back to defaults if missing."""
+    try:
+        with open(SETTINGS_PATH, "r", encoding="utf-8") as f:
+            return (yaml.safe_load(f) or {}).get('ui', {}) or {}
+    except (OSError, yaml.YAMLError):
+        return {}
+
+ui_config = get_ui_config()
+LOG_PAGE_SIZE = ui_config.get('log_page_size', 50)
+
 # --- Session State Initialization ---
 if 'logs' not in st.session_state:
-    st.session_state.logs = []
+    st.session_state.logs = LogBuffer(ui_config.get('max_log_entries', 1000))
 if 'raw_data' not in st.session_state:
+    # Holds a lease on a shared dataset (see DatasetRegistry), not a private copy
     st.session_state.raw_data = None
 
 def add_log(message):
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    st.session_state.logs.append(f"[{timestamp}] {message}")
+    st.session_state.logs.append(message)
 
 # --- Sidebar Implementation ---
 with st.sidebar:
@@ -208,7 +207,10 @@ with st.sidebar:
             time.sleep(1.5)
             # For demonstration, we load the local xls file as our "API" data
             try:
-                st.session_state.raw_data = pd.read_excel("Trade record 2026-01-09_10_27.xls")
+                lease = get_dataset_registry().acquire_file("Trade record 2026-01-09_10_27.xls")
+                if st.session_state.raw_data is not None:
+                    st.session_state.raw_data.release()
+                st.session_state.raw_data = lease
                 add_log("Successfully fetched latest trade records from API.")
                 st.toast("Data Refreshed!", icon="✅")
             except Exception as e:
@@ -229,7 +231,7 @@ with tab1:
             
             if st.session_state.raw_data is not None:
                 # 1. Standardize Data
-                processed_df = standardize_data(st.session_state.raw_data, df_targets)
+                processed_df = standardize_data(st.session_state.raw_data.data, df_targets)
                 
                 # 2. Search Filter
                 search_query = st.text_input("🔍 Search Products", placeholder="Enter keyword (e.g., 'ASUKD 1897')")
@@ -271,10 +273,14 @@ with tab1:
 
 with tab2:
     st.markdown("### 🛠️ Execution Logs")
-    log_text = "\n".join(reversed(st.session_state.logs))
+    logs = st.session_state.logs
+    page_count = logs.page_count(LOG_PAGE_SIZE)
+    page = st.number_input("Page (newest first)", min_value=1, max_value=page_count, value=1, step=1)
+    log_text = "\n".join(logs.page(page, LOG_PAGE_SIZE))
     st.text_area("Live Stream", value=log_text, height=400, disabled=True)
+    st.caption(f"Page {page}/{page_count} · {len(logs)} entries kept (oldest entries are dropped automatically)")
     if st.button("🗑️ Clear Logs"):
-        st.session_state.logs = []
+        logs.clear()
         st.rerun()
 
 # --- Footer ---
@@ -0,0 +1,120 @@
+import io
+import time
+import hashlib
+import logging
+import threading
+import weakref
+import itertools
+from collections import deque
+from typing import List
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class LogBuffer:
+    """
+    Per-session ring buffer for log lines.
+    Only the newest `max_entries` lines are kept, so memory stays flat over long sessions.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self._entries = deque(maxlen=max_entries)
+
+    def append(self, message: str):
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._entries.append(f"[{timestamp}] {message}")
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def page_count(self, page_size: int) -> int:
+        return max(1, -(-len(self._entries) // page_size))
+
+    def page(self, page: int, page_size: int) -> List[str]:
+        """
+        Returns one page of logs, newest first (pages start at 1).
+        Only iterates up to the requested page instead of rebuilding the whole list.
+        """
+        start = (page - 1) * page_size
+        return list(itertools.islice(reversed(self._entries), start, start + page_size))
+
+
+class DatasetLease:
+    """
+    A session's handle on a shared dataset, kept in st.session_state.
+    The reference count drops on release() or when the lease is garbage-collected with its session.
+    """
+
+    def __init__(self, registry, key: str):
+        self.key = key
+        self._registry = registry
+        self._finalizer = weakref.finalize(self, registry._release, key)
+
+    @property
+    def data(self) -> pd.DataFrame:
+        """The shared DataFrame. Treat as read-only; .copy() before modifying."""
+        return self._registry._get(self.key)
+
+    def release(self):
+        self._finalizer()
+
+
+class DatasetRegistry:
+    """
+    DataFrames shared across sessions, keyed by the sha256 of the source file content.
+
+    - Several users loading the same file share a single DataFrame in memory.
+    - Reference-counted: a dataset is dropped once no session holds a lease on it.
+
+    Wrap in st.cache_resource so every session on the server uses the same registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datasets = {}  # key -> [DataFrame, refcount]
+
+    def acquire_file(self, path: str, reader=pd.read_excel) -> DatasetLease:
+        """Reads `path` and returns a lease on the shared DataFrame, parsing it only if not loaded yet."""
+        with open(path, "rb") as f:
+            content = f.read()
+        key = hashlib.sha256(content).hexdigest()
+
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is not None:
+                entry[1] += 1
+                return DatasetLease(self, key)
+
+        # Parse outside the lock so other sessions reading their datasets are never blocked.
+        # Two sessions loading the same new file at once may both parse it; the first insert wins.
+        df = reader(io.BytesIO(content))
+
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is None:
+                entry = self._datasets[key] = [df, 0]
+                logger.info(f"Loaded dataset {key[:12]} ({len(df)} rows)")
+            entry[1] += 1
+        return DatasetLease(self, key)
+
+    def _get(self, key: str) -> pd.DataFrame:
+        with self._lock:
+            return self._datasets[key][0]
+
+    def _release(self, key: str):
+        with self._lock:
+            entry = self._datasets.get(key)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._datasets[key]
+                logger.info(f"Released dataset {key[:12]} (no sessions left)")
+
+    def __len__(self):
+        return len(self._datasets)
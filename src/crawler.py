@@ -1,11 +1,139 @@
+import re
 import time
+import queue
+import json
+import hashlib
 import logging
+import itertools
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Generator
 
 # Lấy logger theo tên module
 logger = logging.getLogger(__name__)
 
+# Payload mặc định của API Search/TradeDataV2.
+# Các preset trong settings.yaml (mục `payload_presets`) sẽ ghi đè lên các giá trị này.
+DEFAULT_PAYLOAD = {
+    "keydoc": "",
+    "countryCode": "",
+    "ie": "i",
+    "startDate": "",
+    "endDate": "",
+    "hsCode": "",
+    "product": "",
+    "importer": "",
+    "exporter": "",
+    "loadingPort": "",
+    "unLoadingPort": "",
+    "country": "",
+    "billNo": "",
+    "isShip": True,
+    "isNotNullImporter": False,
+    "isNotNullExporter": False,
+    "isNotImporterForwarder": False,
+    "isNotExporterForwarder": False,
+    "languages": "en",
+    "searchType": 2,
+    "sortType": 0,
+    "minValueWeight": 0,
+    "maxValueWeight": 0,
+    "minValueNumber": 0,
+    "maxValueNumber": 0,
+    "minValuePrice": 0,
+    "maxValuePrice": 0,
+    "downloadNum": 500,
+    "smtpIndex": 0,
+    "pageIndex": 1,
+    "pageSize": 50,
+    "threeEnCountryCode": "VNM",
+    "code": "",
+    "cKey": ""
+}
+
+# Trường định danh record dùng để loại trùng khi gộp kết quả fan-out (ghi đè bằng `fanout.dedupe_keys`)
+DEFAULT_DEDUPE_KEYS = ["id"]
+
+# Đánh dấu 1 sub-query đã chạy xong (dùng trong fetch_data_fanout)
+_DONE = object()
+
+
+def split_terms(value: Optional[str], separators: str = ";") -> List[str]:
+    """Tách chuỗi 'A;B;C' thành ['A', 'B', 'C'] (bỏ khoảng trắng + phần tử rỗng)."""
+    if not value:
+        return []
+    parts = re.split(f"[{re.escape(separators)}]", value)
+    return [p.strip() for p in parts if p.strip()]
+
+
+class RecordDeduper:
+    """
+    Loại các record trùng khi gộp kết quả nhiều sub-query.
+
+    - Khóa chính: bộ giá trị của `dedupe_keys` (vd: ['id']).
+    - Record không có trường khóa nào -> dùng khóa theo nội dung (hash của toàn bộ record),
+      và ghi log 1 lần để biết API không trả về trường khóa đã cấu hình.
+    - dedupe_keys rỗng -> không loại trùng.
+    """
+
+    def __init__(self, dedupe_keys: List[str]):
+        self.dedupe_keys = list(dedupe_keys or [])
+        self._seen = set()
+        self._fallback_logged = False
+
+    def _key(self, record: Dict):
+        key = tuple(record.get(k) for k in self.dedupe_keys)
+        if any(v is not None for v in key):
+            return key
+
+        if not self._fallback_logged:
+            logger.warning(
+                f"Record không có trường khóa {self.dedupe_keys}, loại trùng theo toàn bộ nội dung record."
+            )
+            self._fallback_logged = True
+        raw = json.dumps(record, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.md5(raw.encode("utf-8")).digest()
+
+    def filter(self, page_data: List[Dict]) -> List[Dict]:
+        if not self.dedupe_keys:
+            return page_data
+
+        unique = []
+        for record in page_data:
+            key = self._key(record)
+            if key not in self._seen:
+                self._seen.add(key)
+                unique.append(record)
+        return unique
+
+
+class RateLimiter:
+    """
+    Giới hạn tốc độ gọi API, dùng chung cho tất cả các thread của 1 crawler.
+    Đảm bảo 2 request liên tiếp (bất kể thread nào) cách nhau ít nhất `interval` giây.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self, stop_event: Optional[threading.Event] = None) -> bool:
+        """
+        Chờ tới lượt gọi API. Trả về False nếu `stop_event` được set trong lúc chờ.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if delay <= 0:
+            return True
+        if stop_event is None:
+            time.sleep(delay)
+            return True
+        return not stop_event.wait(delay)
+
 class TradeDataCrawler:
     def __init__(self, config, auth):
         self.config = config
@@ -13,6 +141,7 @@ class TradeDataCrawler:
         self.base_url = config['crawler'].get('base_url', "https://system-tradedata.pro/api")
         self.token = None
         self.session = requests.Session()
+        self.rate_limiter = RateLimiter(config['crawler'].get('sleep_time', 3.6))
         self.headers = {
             "Content-Type": "application/json",
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
@@ -54,7 +183,43 @@ class TradeDataCrawler:
             logger.exception(f"Lỗi khi đăng nhập: {e}")
             return False
 
-    def fetch_data_generator(self, start_date: str, end_date: str, company_name: str = "", hs_code: str = "") -> Generator[List[Dict], None, None]:
+    def _new_session(self) -> requests.Session:
+        """Tạo session riêng (cùng Token) cho mỗi thread, vì requests.Session không thread-safe."""
+        session = requests.Session()
+        session.headers.update(self.session.headers)
+        return session
+
+    def build_payload(self, start_date: str, end_date: str, company_name: str = "", hs_code: str = "",
+                      country_code: Optional[str] = None, preset: Optional[str] = None) -> Dict:
+        """
+        Ghép payload tìm kiếm theo thứ tự ưu tiên:
+        DEFAULT_PAYLOAD < preset trong settings.yaml < tham số truyền vào.
+
+        - preset (str): Tên preset trong `payload_presets`. Nếu None -> dùng `crawler.payload_preset`.
+        - country_code (str): Mã nước 3 ký tự (vd: 'VNM'). Nếu None -> giữ giá trị của preset.
+        """
+        presets = self.config.get('payload_presets', {}) or {}
+        preset = preset or self.config.get('crawler', {}).get('payload_preset', 'default')
+
+        if preset not in presets and preset != 'default':
+            raise ValueError(f"Không tìm thấy payload preset '{preset}' trong settings.yaml")
+
+        payload = dict(DEFAULT_PAYLOAD)
+        payload.update(presets.get(preset) or {})
+        payload.update({
+            "keydoc": company_name,
+            "startDate": start_date,
+            "endDate": end_date,
+            "hsCode": hs_code,
+        })
+        if country_code is not None:
+            payload["threeEnCountryCode"] = country_code
+        return payload
+
+    def fetch_data_generator(self, start_date: str, end_date: str, company_name: str = "", hs_code: str = "",
+                             country_code: Optional[str] = None, preset: Optional[str] = None,
+                             session: Optional[requests.Session] = None,
+                             stop_event: Optional[threading.Event] = None) -> Generator[List[Dict], None, None]:
         """
         Hàm Generator dùng để stream dữ liệu (Streaming).
         
@@ -62,6 +227,10 @@ class TradeDataCrawler:
         - start_date, end_date (str): Định dạng 'YYYY-MM-DD'
         - company_name (str): Tên các công ty. Phân cách bởi dấu ';'
         - hs_code (str): Phân cách bởi dấu ';'
+        - country_code (str): Ghi đè `threeEnCountryCode` của preset (tùy chọn)
+        - preset (str): Tên payload preset trong settings.yaml (tùy chọn)
+        - session: requests.Session dùng để gọi API (mặc định: self.session)
+        - stop_event: Khi được set (từ thread khác), dừng trước request kế tiếp / lần retry kế tiếp
         
         OUTPUT (Yield):
         - Trả về từng gói dữ liệu (List[Dict]) mỗi khi crawl xong 1 trang.
@@ -75,6 +244,7 @@ class TradeDataCrawler:
             return
 
         search_url = f"{self.base_url}/Search/TradeDataV2"
+        session = session or self.session
         current_page = 1
         
         # --- LẤY CẤU HÌNH TỪ YAML ---
@@ -90,44 +260,11 @@ class TradeDataCrawler:
         
         total_items_fetched = 0 
 
-        # Payload cấu hình
-        payload = {
-            "keydoc": company_name,
-            "countryCode": "",
-            "ie": "i",
-            "startDate": start_date,
-            "endDate": end_date,
-            "hsCode": hs_code,
-            "product": "",
-            "importer": "",
-            "exporter": "",
-            "loadingPort": "",
-            "unLoadingPort": "",
-            "country": "",
-            "billNo": "",
-            "isShip": True,
-            "isNotNullImporter": False,
-            "isNotNullExporter": False,
-            "isNotImporterForwarder": False,
-            "isNotExporterForwarder": False,
-            "languages": "en",
-            "searchType": 2,
-            "sortType": 0,
-            "minValueWeight": 0,
-            "maxValueWeight": 0,
-            "minValueNumber": 0,
-            "maxValueNumber": 0,
-            "minValuePrice": 0,
-            "maxValuePrice": 0,
-            "downloadNum": 500,
-            "smtpIndex": 0,
-            "pageIndex": current_page, # Sử dụng biến current_page
-            "pageSize": 50,
-            # "threeEnCountryCode": "ETH,UGA,KEN,DZA,DJI,EGY,GHA,RWA,SYC,GMB,CMR,COD,ZMB,MRT,CPV,MDG,STP,ZWE,LBR,MAR,SOM,NAM,BDI,ERI,SLE,GNQ,CAF,MOZ,NGA,COM,BWA,CIV,NER,ZAF,GIN,SDN,AGO,TZA,LBY,MUS,MYT,SWZ,MLI,TUN,LSO,MWI,GNB,TCD,SSD,IND,VNM,PAK,IDN,PHL,UZB,KGZ,KAZ,LKA,AFG,ARE,BHR,BGD,CHN,IRN,IRQ,JPN,KOR,KWT,MYS,OMN,QAT,SAU,SGP,TWN,THA,TUR,AZE,PSE,MAC,ISR,BRN,KHM,MDV,GEO,CUW,JOR,MNG,SYR,TJK,NPL,LBN,YEM,HKG,MMR,CYP,TLS,TKM,YDY,CIS,CAT,LAO,RUS,UKR,GBR,AEU,BEL,DNK,FIN,FRA,DEU,GRC,ITA,NLD,NOR,ESP,MDA,SHN,FRO,SXM,BIH,REU,GIB,LVA,AUT,SRB,BGR,CZE,MLT,SWE,MKD,HUN,LTU,MNE,CHE,POL,ALB,EST,ROU,BLR,LUX,IRL,SVN,HRV,ISL,PRT,SVK,LIE,RKS,MEX,CRI,USA,HND,GTM,NIC,SLV,CAN,TCA,ASM,CYM,DOM,JAM,CUB,BMU,LCA,DMA,BHS,BLZ,KNA,BRB,GRD,MSR,TTO,AIA,ABW,GRL,ATG,VCT,HTI,MTQ,GLP,PRI,AUS,WLF,FSM,PNG,FJI,NCL,TON,PYF,SLB,MNP,COK,KIR,GUM,VUT,WSM,VGB,VIR,NZL,ARG,CHL,COL,ECU,PAN,PER,PRY,BOL,URY,VEN,BRA,PEU,SUR,GUY,GUF",
-            "threeEnCountryCode": "VNM",
-            "code": "",
-            "cKey": ""
-        }
+        # Payload cấu hình (DEFAULT_PAYLOAD + preset trong settings.yaml + tham số truyền vào)
+        payload = self.build_payload(
+            start_date, end_date, company_name, hs_code,
+            country_code=country_code, preset=preset
+        )
         logger.info(f"Bắt đầu Crawl: {start_date} -> {end_date}")
         if max_pages or max_items:
             logger.info(f"Cấu hình giới hạn: Max Pages={max_pages}, Max Items={max_items}")
@@ -136,6 +273,11 @@ class TradeDataCrawler:
 
         while True:
             # --- KIỂM TRA GIỚI HẠN (SAFETY BREAKERS) ---
+
+            # 0. Bị hủy từ bên ngoài (vd: pipeline lỗi / UI dừng)
+            if stop_event is not None and stop_event.is_set():
+                logger.info(f"⏹ Nhận tín hiệu dừng trước trang {current_page}. Dừng.")
+                break
             
             # 1. Check số trang (chỉ kích hoạt nếu max_pages > 0)
             if max_pages and current_page > max_pages:
@@ -148,9 +290,14 @@ class TradeDataCrawler:
                 break
 
             payload["pageIndex"] = current_page
+
+            # Chờ tới lượt theo giới hạn tốc độ chung (thay cho sleep cố định sau mỗi trang)
+            if not self.rate_limiter.wait(stop_event):
+                logger.info(f"⏹ Nhận tín hiệu dừng trước trang {current_page}. Dừng.")
+                break
             
             try:
-                response = self.session.post(
+                response = session.post(
                     search_url, json=payload, headers=self.headers, timeout=30
                 )
                 response.raise_for_status()
@@ -177,10 +324,145 @@ class TradeDataCrawler:
                     
             except requests.exceptions.Timeout:
                 logger.error(f"Timeout trang {current_page}. Retry sau {sleep_time}s...")
-                time.sleep(sleep_time)
+                if stop_event is not None:
+                    if stop_event.wait(sleep_time):
+                        break
+                else:
+                    time.sleep(sleep_time)
                 continue
             except Exception as e:
                 logger.exception(f"Lỗi crawl trang {current_page}: {e}")
                 break
-            
-            time.sleep(sleep_time)
\ No newline at end of file
+
+    def fetch_data_fanout(self, start_date: str, end_date: str, company_name: str = "", hs_code: str = "",
+                          country_code: Optional[str] = None, preset: Optional[str] = None,
+                          stop_event: Optional[threading.Event] = None) -> Generator[List[Dict], None, None]:
+        """
+        Giống fetch_data_generator nhưng chia nhỏ truy vấn (Fan-out).
+
+        - company_name, hs_code: Phân cách bởi dấu ';'
+        - country_code: Phân cách bởi dấu ';' hoặc ','. Nếu None -> tách `threeEnCountryCode` của preset.
+        - stop_event: Khi được set (từ thread khác), dừng chờ dữ liệu và kết thúc sớm.
+
+        Mỗi tổ hợp (công ty x HS code x nước) là 1 sub-query độc lập, chạy song song
+        trong ThreadPool (`fanout.max_workers`) nhưng vẫn dùng chung RateLimiter.
+        Kết quả được gộp lại và loại trùng theo `fanout.dedupe_keys` (mặc định: ['id']);
+        record không có các trường này thì loại trùng theo toàn bộ nội dung (xem RecordDeduper).
+
+        LƯU Ý: max_pages / max_items trong settings.yaml áp dụng cho TOÀN BỘ luồng dữ liệu đã gộp
+        (không nhân lên theo số sub-query). Loại trùng + giới hạn áp dụng giống nhau dù có 1 hay nhiều sub-query.
+        """
+        if not self.token:
+            logger.error("Chưa có Token. Vui lòng chạy login() trước.")
+            return
+
+        crawler_cfg = self.config.get('crawler', {})
+        max_pages = crawler_cfg.get('max_pages')
+        max_items = crawler_cfg.get('max_items')
+
+        fanout_cfg = self.config.get('fanout', {}) or {}
+        max_workers = fanout_cfg.get('max_workers', 4)
+        dedupe_keys = fanout_cfg.get('dedupe_keys', DEFAULT_DEDUPE_KEYS) or []
+
+        # Không truyền country_code -> tách danh sách nước của preset (vd: preset all_countries)
+        if country_code is None:
+            country_code = self.build_payload(start_date, end_date, preset=preset)["threeEnCountryCode"]
+
+        # Giữ nguyên chuỗi gốc nếu không có gì để tách (để API tự xử lý như cũ)
+        companies = split_terms(company_name) or [company_name]
+        hs_codes = split_terms(hs_code) or [hs_code]
+        countries = split_terms(country_code, ";,") or [country_code]
+        sub_queries = list(itertools.product(companies, hs_codes, countries))
+
+        if len(sub_queries) == 1:
+            # Dùng giá trị đã chuẩn hóa (vd: 'A;' -> 'A'), không gửi dấu phân cách thừa lên API
+            company, code, country = sub_queries[0]
+            source = self.fetch_data_generator(
+                start_date, end_date, company, code, country_code=country, preset=preset,
+                stop_event=stop_event
+            )
+        else:
+            logger.info(f"Fan-out: {len(sub_queries)} sub-query, {max_workers} luồng song song")
+            source = self._fanout_pages(start_date, end_date, sub_queries, preset, max_workers, stop_event)
+
+        deduper = RecordDeduper(dedupe_keys)
+        total_items = 0
+        pages_received = 0
+        try:
+            for page_data in source:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                pages_received += 1
+
+                unique = deduper.filter(page_data)
+                if max_items:
+                    unique = unique[:max_items - total_items]
+                if unique:
+                    total_items += len(unique)
+                    yield unique
+
+                if max_items and total_items >= max_items:
+                    logger.info(f"⏹ Đã đạt giới hạn {max_items} dòng (theo Config). Dừng tất cả sub-query.")
+                    break
+                if max_pages and pages_received >= max_pages:
+                    logger.info(f"⏹ Đã đạt giới hạn {max_pages} trang (theo Config). Dừng tất cả sub-query.")
+                    break
+        finally:
+            # Đóng nguồn dữ liệu -> các worker (nếu có) nhận tín hiệu dừng
+            source.close()
+
+        logger.info(f"✅ Fan-out hoàn tất: {total_items} dòng (đã loại trùng)")
+
+    def _fanout_pages(self, start_date: str, end_date: str, sub_queries: List[tuple],
+                      preset: Optional[str], max_workers: int,
+                      cancel_event: Optional[threading.Event] = None) -> Generator[List[Dict], None, None]:
+        """Chạy các sub-query song song, yield từng trang (chưa loại trùng) theo thứ tự về trước."""
+        pages = queue.Queue(maxsize=max_workers * 2)
+        stop_event = threading.Event()
+
+        def put(item):
+            # put() có timeout để thread không bị treo khi phía tiêu thụ đã dừng
+            while not stop_event.is_set():
+                try:
+                    pages.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker(company, code, country):
+            session = self._new_session()
+            try:
+                for page_data in self.fetch_data_generator(
+                    start_date, end_date, company, code,
+                    country_code=country, preset=preset, session=session, stop_event=stop_event
+                ):
+                    if not put(page_data):
+                        break
+            except Exception as e:
+                logger.exception(f"Lỗi sub-query ({company}, {code}, {country}): {e}")
+            finally:
+                session.close()
+                put(_DONE)
+
+        remaining = len(sub_queries)
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        try:
+            for company, code, country in sub_queries:
+                executor.submit(worker, company, code, country)
+
+            while remaining:
+                # get() có timeout để kiểm tra tín hiệu dừng từ bên ngoài (vd: pipeline bị hủy)
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                try:
+                    item = pages.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    remaining -= 1
+                    continue
+                yield item
+        finally:
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import zipfile
+import logging
+from typing import List, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def prune_old_bundles(output_dir: str, max_age_hours: float) -> int:
+    """
+    Xóa các file ZIP cũ hơn `max_age_hours` trong `output_dir` (tránh đầy ổ đĩa).
+    Trả về số file đã xóa. max_age_hours <= 0 hoặc None -> không xóa gì.
+    """
+    if not max_age_hours or max_age_hours <= 0 or not os.path.isdir(output_dir):
+        return 0
+
+    cutoff = time.time() - max_age_hours * 3600
+    removed = 0
+    for entry in os.scandir(output_dir):
+        if not entry.is_file() or not entry.name.endswith(".zip"):
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError as e:
+            # File có thể đang được session khác xóa/ghi -> bỏ qua
+            logger.warning(f"Không xóa được bundle cũ {entry.path}: {e}")
+
+    if removed:
+        logger.info(f"🧹 Đã xóa {removed} bundle cũ hơn {max_age_hours} giờ trong {output_dir}")
+    return removed
+
+
+class _HashingReader:
+    """Bọc file-like object: vừa đọc vừa tính checksum + đếm số byte."""
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def read(self, n=-1):
+        chunk = self.fileobj.read(n)
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+
+class ExportBundler:
+    """
+    Gom các file part (Excel) vào MỘT file ZIP duy nhất trên ổ đĩa.
+
+    - Mỗi part được ghi thẳng vào ZIP ngay khi tạo xong (trong lúc crawl vẫn đang chạy),
+      sau đó bộ nhớ của part được giải phóng -> RAM không tăng theo số lượng part.
+    - Cuối cùng ghi thêm `manifest.json` chứa số dòng + checksum (sha256) của từng part.
+
+    Cách dùng:
+        with ExportBundler(config) as bundler:
+            bundler.add_part("trade_data_part_1.xlsx", excel_bytes, rows=1000)
+        bundler.path  # -> đường dẫn file ZIP để đưa vào nút Download
+    """
+
+    def __init__(self, config, file_name: Optional[str] = None):
+        export_cfg = config.get('export', {}) or {}
+        self.output_dir = export_cfg.get('output_dir', 'exports')
+        self.compress_level = export_cfg.get('compress_level', 6)
+
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir, exist_ok=True)
+
+        # Dọn các bundle cũ trước khi tạo bundle mới
+        prune_old_bundles(self.output_dir, export_cfg.get('max_age_hours', 24))
+
+        if not file_name:
+            # Thêm hậu tố ngẫu nhiên: nhiều người dùng chung server có thể tạo bundle trong cùng 1 giây
+            file_name = f"trade_data_{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.zip"
+        self.path = os.path.join(self.output_dir, file_name)
+
+        self.parts: List[Dict] = []
+        self._zip = zipfile.ZipFile(
+            self.path, mode="x",  # "x": không bao giờ ghi đè bundle đã tồn tại
+            compression=zipfile.ZIP_DEFLATED,
+            compresslevel=self.compress_level,
+        )
+        logger.info(f"Mở file bundle: {self.path} (compress_level={self.compress_level})")
+
+    def add_part(self, name: str, fileobj, rows: int) -> Dict:
+        """
+        Ghi 1 part vào ZIP theo kiểu stream (copy từng khối, không nhân bản dữ liệu).
+
+        INPUT:
+        - name (str): Tên file bên trong ZIP (vd: 'trade_data_part_1.xlsx').
+        - fileobj: File-like object (vd: io.BytesIO từ create_excel_bytes).
+        - rows (int): Số dòng dữ liệu của part (ghi vào manifest).
+
+        OUTPUT:
+        - Dict: Thông tin part vừa ghi (name, rows, bytes, sha256).
+        """
+        if self._zip is None:
+            raise RuntimeError("Bundle đã đóng, không thể thêm part.")
+        if name == MANIFEST_NAME or any(p['name'] == name for p in self.parts):
+            # zipfile chỉ cảnh báo khi trùng tên -> ZIP có 2 entry cùng tên, manifest không rõ ràng
+            raise ValueError(f"Tên part '{name}' đã tồn tại trong bundle.")
+
+        fileobj.seek(0)
+        reader = _HashingReader(fileobj)
+        with self._zip.open(name, mode="w", force_zip64=True) as dest:
+            shutil.copyfileobj(reader, dest)
+
+        part = {
+            'name': name,
+            'rows': int(rows),
+            'bytes': reader.size,
+            'sha256': reader.sha256.hexdigest(),
+        }
+        self.parts.append(part)
+        logger.info(f"📦 Đã thêm {name} vào bundle ({rows} dòng, {reader.size} bytes)")
+        return part
+
+    @property
+    def total_rows(self) -> int:
+        return sum(p['rows'] for p in self.parts)
+
+    def close(self) -> str:
+        """Ghi manifest.json và đóng file ZIP. Trả về đường dẫn file ZIP."""
+        if self._zip is None:
+            return self.path
+
+        manifest = {
+            'created_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+            'total_rows': self.total_rows,
+            'parts': self.parts,
+        }
+        self._zip.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2))
+        self._zip.close()
+        self._zip = None
+
+        logger.info(f"✅ Đã đóng bundle: {self.path} ({len(self.parts)} part, {self.total_rows} dòng)")
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
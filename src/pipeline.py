@@ -0,0 +1,206 @@
+import time
+import queue
+import logging
+import threading
+import pandas as pd
+from typing import Dict, Generator
+
+logger = logging.getLogger(__name__)
+
+# Đánh dấu stage phía trước đã chạy xong
+_SENTINEL = object()
+
+
+class _Stopped(Exception):
+    """Pipeline đã bị dừng (do lỗi ở stage khác hoặc phía UI ngừng đọc)."""
+
+
+class CrawlPipeline:
+    """
+    Pipeline 3 stage, mỗi stage chạy trong 1 thread riêng, nối với nhau bằng hàng đợi có giới hạn:
+
+        [crawl] --raw_q--> [process] --clean_q--> [write]
+
+    - crawl:   Lấy từng trang từ crawler.fetch_data_fanout().
+    - process: Gom trang thành từng part (max_rows_per_file) và chuẩn hóa (clean_dataframe).
+    - write:   Ghi Excel và đưa vào ExportBundler.
+
+    Nhờ vậy thời gian chờ mạng (rate limit) và thời gian ghi Excel chạy chồng lên nhau.
+    Hàng đợi có `maxsize` (back-pressure): khi writer chậm, các stage trước sẽ tự chờ,
+    nên RAM bị giới hạn ở khoảng queue_size trang/part.
+
+    Cách dùng (trong thread của Streamlit):
+        pipeline = CrawlPipeline(config, crawler, processor, bundler)
+        for event in pipeline.run(start_date, end_date, company_name, hs_code):
+            status_box.info(...)  # Cập nhật UI theo event
+    """
+
+    def __init__(self, config, crawler, processor, bundler):
+        pipeline_cfg = config.get('pipeline', {}) or {}
+        self.queue_size = pipeline_cfg.get('queue_size', 4)
+        self.join_timeout = pipeline_cfg.get('join_timeout', 5)
+        self.max_rows = config['processing'].get('max_rows_per_file', 50000)
+
+        self.crawler = crawler
+        self.processor = processor
+        self.bundler = bundler
+
+        self._raw_q = queue.Queue(maxsize=self.queue_size)
+        self._clean_q = queue.Queue(maxsize=self.queue_size)
+        self._events = queue.Queue()
+        self._stop = threading.Event()
+        self._errors = []
+        self._started = False
+
+    # --- TIỆN ÍCH ---
+    def _put(self, q, item):
+        """put() có timeout để thread không bị treo vĩnh viễn khi pipeline đã dừng."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _Stopped()
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        raise _Stopped()
+
+    def _run_stage(self, name, target, out_q, *args):
+        try:
+            target(*args)
+        except _Stopped:
+            pass
+        except Exception as e:
+            logger.exception(f"Lỗi ở stage '{name}': {e}")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            if out_q is not None and not self._stop.is_set():
+                try:
+                    self._put(out_q, _SENTINEL)
+                except _Stopped:
+                    pass
+            self._events.put({'stage': name, 'done': True})
+
+    # --- CÁC STAGE ---
+    def _crawl(self, start_date, end_date, company_name, hs_code):
+        total_fetched = 0
+        data_gen = self.crawler.fetch_data_fanout(
+            start_date, end_date, company_name, hs_code, stop_event=self._stop
+        )
+        try:
+            for page_data in data_gen:
+                if not page_data:
+                    continue
+                self._put(self._raw_q, page_data)
+                total_fetched += len(page_data)
+                self._events.put({'stage': 'crawl', 'total_fetched': total_fetched})
+        finally:
+            data_gen.close()
+
+    def _process(self):
+        buffer = []
+        part_index = 1
+
+        def emit(rows):
+            nonlocal part_index
+            df_clean = self.processor.clean_dataframe(pd.DataFrame(rows))
+            self._put(self._clean_q, (part_index, df_clean, len(rows)))
+            part_index += 1
+
+        while True:
+            page_data = self._get(self._raw_q)
+            if page_data is _SENTINEL:
+                break
+            buffer.extend(page_data)
+            self._events.put({'stage': 'process', 'buffered': len(buffer), 'part_index': part_index})
+
+            # Xô đầy -> cắt ra làm part, phần dư giữ lại cho đợt sau
+            while len(buffer) >= self.max_rows:
+                chunk, buffer = buffer[:self.max_rows], buffer[self.max_rows:]
+                emit(chunk)
+
+        # Phần còn lại (LEFTOVER)
+        if buffer:
+            emit(buffer)
+
+    def _write(self):
+        while True:
+            item = self._get(self._clean_q)
+            if item is _SENTINEL:
+                break
+            part_index, df_clean, rows = item
+            file_name = f"trade_data_part_{part_index}.xlsx"
+            self._events.put({'stage': 'write', 'file_name': file_name, 'rows': rows})
+
+            excel_bytes = self.processor.write_excel_bytes(df_clean)
+            if excel_bytes:
+                self.bundler.add_part(file_name, excel_bytes, rows=rows)
+                self._events.put({'stage': 'write', 'file_name': file_name, 'parts': len(self.bundler.parts)})
+
+    # --- ĐIỀU PHỐI ---
+    def run(self, start_date: str, end_date: str, company_name: str = "", hs_code: str = "") -> Generator[Dict, None, None]:
+        """
+        Chạy pipeline và yield các event tiến độ (Dict) cho thread gọi (UI).
+
+        Mỗi event có khóa 'stage' ('crawl' | 'process' | 'write') kèm thông tin tương ứng:
+        - crawl:   total_fetched
+        - process: buffered, part_index
+        - write:   file_name, rows (bắt đầu ghi) hoặc file_name, parts (ghi xong)
+
+        Nếu 1 stage bị lỗi, toàn bộ pipeline dừng và lỗi đó được raise lại ở đây.
+        Mỗi CrawlPipeline chỉ chạy được 1 lần (hàng đợi + cờ dừng không dùng lại được).
+        """
+        if self._started:
+            raise RuntimeError("CrawlPipeline chỉ chạy được 1 lần. Hãy tạo pipeline mới cho lần crawl tiếp theo.")
+        self._started = True
+
+        stages = [
+            ('crawl', self._crawl, self._raw_q, (start_date, end_date, company_name, hs_code)),
+            ('process', self._process, self._clean_q, ()),
+            ('write', self._write, None, ()),
+        ]
+        threads = [
+            threading.Thread(
+                target=self._run_stage, args=(name, target, out_q, *args),
+                name=f"pipeline-{name}", daemon=True
+            )
+            for name, target, out_q, args in stages
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            remaining = len(threads)
+            while remaining:
+                # Có lỗi ở 1 stage -> thoát ngay, không đợi các stage khác báo 'done'
+                # (stage crawl có thể đang kẹt ở 1 request HTTP). Việc chờ dừng do join có timeout bên dưới lo.
+                if self._stop.is_set() or self._errors:
+                    break
+                try:
+                    event = self._events.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if event.get('done'):
+                    remaining -= 1
+                    continue
+                yield event
+        finally:
+            # Phía UI ngừng đọc (hoặc có lỗi) -> báo cho các stage dừng lại.
+            # join có timeout: stage crawl có thể đang chờ 1 request HTTP, không để UI bị treo theo.
+            # Các thread là daemon nên sẽ tự kết thúc sau khi request đó xong.
+            self._stop.set()
+            deadline = time.monotonic() + self.join_timeout
+            for t in threads:
+                t.join(timeout=max(0, deadline - time.monotonic()))
+                if t.is_alive():
+                    logger.warning(f"Thread {t.name} chưa dừng sau {self.join_timeout}s, bỏ qua (daemon).")
+
+        if self._errors:
+            raise self._errors[0]
@@ -16,6 +16,7 @@ class DataPreprocessor:
     def create_excel_bytes(self, df):
         """
         Biến đổi DataFrame thành file Excel (lưu trong RAM).
+        Gồm 2 giai đoạn: clean_dataframe() -> write_excel_bytes().
         
         INPUT:
         - df: DataFrame chứa dữ liệu cần ghi vào file.
@@ -26,8 +27,18 @@ class DataPreprocessor:
         """
         if df.empty:
             return None
+        return self.write_excel_bytes(self.clean_dataframe(df))
 
-        # --- GIAI ĐOẠN 1: CLEAN DATA ---
+    def clean_dataframe(self, df):
+        """
+        GIAI ĐOẠN 1: CLEAN DATA (lọc cột, format số tiền, đổi tên cột).
+        
+        INPUT:
+        - df: DataFrame dữ liệu thô từ API.
+        
+        OUTPUT:
+        - DataFrame đã chuẩn hóa, sẵn sàng ghi ra Excel.
+        """
         # 1. Lọc cột
         existing_cols = [col for col in self.extract_cols if col in df.columns]
         df_clean = df[existing_cols].copy() # Dùng .copy() để tránh warning SettingWithCopy
@@ -41,9 +52,15 @@ class DataPreprocessor:
                 pass
 
         # 3. Rename cột
-        df_clean = df_clean.rename(columns=self.mapping)
+        return df_clean.rename(columns=self.mapping)
 
-        # --- GIAI ĐOẠN 2: WRITE EXCEL ---
+    def write_excel_bytes(self, df_clean):
+        """
+        GIAI ĐOẠN 2: WRITE EXCEL (ghi DataFrame đã clean ra file Excel trong RAM).
+        
+        OUTPUT:
+        - io.BytesIO, hoặc None nếu lỗi.
+        """
         output = io.BytesIO()
         try:
             with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
@@ -0,0 +1,187 @@
+import time
+import threading
+import requests
+from src.crawler import TradeDataCrawler, RateLimiter, split_terms
+
+
+def make_crawler(extra_config=None):
+    config = {'crawler': {'sleep_time': 0}, 'fanout': {'max_workers': 3}}
+    config.update(extra_config or {})
+    crawler = TradeDataCrawler(config, {})
+    crawler.token = "test-token"
+    return crawler
+
+
+def fanout_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("fanout")]
+
+
+# 1. Test split_terms
+assert split_terms("A; B ;;C") == ["A", "B", "C"]
+assert split_terms("VNM,CHN;USA", ";,") == ["VNM", "CHN", "USA"]
+assert split_terms("") == []
+assert split_terms(None) == []
+
+# 2. Test RateLimiter: requests from several threads are spaced by the shared interval
+limiter = RateLimiter(0.05)
+call_times = []
+lock = threading.Lock()
+
+def call_limiter():
+    for _ in range(3):
+        limiter.wait()
+        with lock:
+            call_times.append(time.monotonic())
+
+threads = [threading.Thread(target=call_limiter) for _ in range(3)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+
+call_times.sort()
+span = call_times[-1] - call_times[0]
+print(f"Rate limiter span for 9 calls: {span:.3f}s")
+assert len(call_times) == 9
+# Only the total span is checked (8 intervals), with slack for thread scheduling jitter
+assert span >= 8 * 0.05 * 0.7
+
+# 3. Test cartesian split of companies x HS codes x countries
+calls = []
+
+def recording_generator(start_date, end_date, company_name="", hs_code="",
+                        country_code=None, preset=None, session=None, stop_event=None):
+    with lock:
+        calls.append((company_name, hs_code, country_code))
+    yield [{'id': f"{company_name}-{hs_code}-{country_code}"}]
+
+crawler = make_crawler()
+crawler.fetch_data_generator = recording_generator
+rows = [r for page in crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A;B", "1;2;3", country_code="VNM,CHN") for r in page]
+print(f"Sub-queries: {len(calls)}, rows: {len(rows)}")
+assert len(calls) == 12
+assert set(calls) == {(c, h, n) for c in "AB" for h in "123" for n in ["VNM", "CHN"]}
+assert len(rows) == 12
+
+# 4. Test countries taken from the preset when country_code is not given
+calls.clear()
+crawler = make_crawler({'payload_presets': {'multi': {'threeEnCountryCode': "VNM,CHN,USA"}}})
+crawler.fetch_data_generator = recording_generator
+list(crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1", preset="multi"))
+assert sorted(c[2] for c in calls) == ["CHN", "USA", "VNM"]
+
+# 5. Test dedupe across sub-queries (same record id returned by every sub-query)
+def overlapping_generator(start_date, end_date, company_name="", hs_code="",
+                          country_code=None, preset=None, session=None, stop_event=None):
+    yield [{'id': "shared"}, {'id': f"own-{hs_code}"}]
+    yield [{'id': f"own2-{hs_code}"}]
+
+crawler = make_crawler()
+crawler.fetch_data_generator = overlapping_generator
+rows = [r for page in crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1;2;3") for r in page]
+print(f"Deduped rows: {len(rows)}")
+assert len(rows) == 7
+assert len({r['id'] for r in rows}) == 7
+
+# Same dedupe rule on the single-query path
+rows = [r for page in crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1") for r in page]
+assert [r['id'] for r in rows] == ["shared", "own-1", "own2-1"]
+
+# Records without the configured id are deduped by content
+def no_id_generator(start_date, end_date, company_name="", hs_code="",
+                    country_code=None, preset=None, session=None, stop_event=None):
+    yield [{'product': "shared", 'value': 1}, {'product': f"own-{hs_code}", 'value': 2}]
+
+crawler = make_crawler()
+crawler.fetch_data_generator = no_id_generator
+rows = [r for page in crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1;2;3") for r in page]
+print(f"Deduped rows without id: {len(rows)}")
+assert len(rows) == 4
+assert sorted(r['product'] for r in rows) == ["own-1", "own-2", "own-3", "shared"]
+
+# Single sub-query gets the normalized term, not the raw input with a trailing separator
+calls.clear()
+crawler = make_crawler()
+crawler.fetch_data_generator = recording_generator
+list(crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A;", "1;", country_code="VNM,"))
+assert calls == [("A", "1", "VNM")]
+
+# 6. Test max_items applies to the merged stream, not per sub-query
+crawler = make_crawler({'crawler': {'sleep_time': 0, 'max_items': 4}})
+crawler.fetch_data_generator = overlapping_generator
+rows = [r for page in crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1;2;3") for r in page]
+assert len(rows) == 4
+
+# 7. Test close() stops the workers
+opened, closed = [], []
+
+def endless_generator(start_date, end_date, company_name="", hs_code="",
+                      country_code=None, preset=None, session=None, stop_event=None):
+    with lock:
+        opened.append(hs_code)
+    try:
+        page = 0
+        while True:
+            page += 1
+            yield [{'id': f"{hs_code}-{page}"}]
+    finally:
+        with lock:
+            closed.append(hs_code)
+
+crawler = make_crawler()
+crawler.fetch_data_generator = endless_generator
+data_gen = crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1;2;3")
+next(data_gen)
+data_gen.close()
+
+deadline = time.monotonic() + 5
+while (fanout_threads() or len(closed) < len(opened)) and time.monotonic() < deadline:
+    time.sleep(0.05)
+print(f"Workers opened: {len(opened)}, closed: {len(closed)}, alive threads: {len(fanout_threads())}")
+assert sorted(closed) == sorted(opened)
+assert not fanout_threads()
+
+# 8. Test stop_event ends the fan-out while it is waiting for a slow sub-query
+release = threading.Event()
+
+def slow_generator(start_date, end_date, company_name="", hs_code="",
+                   country_code=None, preset=None, session=None, stop_event=None):
+    release.wait(10)
+    yield [{'id': hs_code}]
+
+crawler = make_crawler()
+crawler.fetch_data_generator = slow_generator
+stop_event = threading.Event()
+threading.Timer(0.2, stop_event.set).start()
+started = time.monotonic()
+rows = list(crawler.fetch_data_fanout("2026-01-01", "2026-01-31", "A", "1;2", stop_event=stop_event))
+elapsed = time.monotonic() - started
+release.set()
+print(f"Stopped waiting after {elapsed:.2f}s")
+assert rows == []
+assert elapsed < 2
+
+# 9. Test fetch_data_generator checks stop_event before each request and while retrying timeouts
+class TimeoutSession:
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        raise requests.exceptions.Timeout()
+
+crawler = make_crawler({'crawler': {'sleep_time': 0.05}})
+session = TimeoutSession()
+stop_event = threading.Event()
+stop_event.set()
+assert list(crawler.fetch_data_generator("2026-01-01", "2026-01-31", session=session, stop_event=stop_event)) == []
+assert session.calls == 0
+
+stop_event = threading.Event()
+threading.Timer(0.3, stop_event.set).start()
+started = time.monotonic()
+assert list(crawler.fetch_data_generator("2026-01-01", "2026-01-31", session=session, stop_event=stop_event)) == []
+print(f"Timeout retries stopped after {time.monotonic() - started:.2f}s ({session.calls} attempts)")
+assert time.monotonic() - started < 2
+
+print("\nAll crawler tests passed!")
@@ -0,0 +1,84 @@
+import io
+import os
+import json
+import time
+import hashlib
+import zipfile
+import tempfile
+from src.exporter import ExportBundler, prune_old_bundles, MANIFEST_NAME
+
+output_dir = tempfile.mkdtemp()
+config = {'export': {'output_dir': output_dir, 'compress_level': 9, 'max_age_hours': 24}}
+
+# 1. Test parts are written and the manifest matches the part bytes
+part_1 = b"part one " * 1000
+part_2 = b"part two " * 500
+
+bundler = ExportBundler(config)
+assert bundler.compress_level == 9
+bundler.add_part("trade_data_part_1.xlsx", io.BytesIO(part_1), rows=1000)
+bundler.add_part("trade_data_part_2.xlsx", io.BytesIO(part_2), rows=500)
+
+# 2. Test duplicate part names are rejected
+for bad_name in ("trade_data_part_1.xlsx", MANIFEST_NAME):
+    try:
+        bundler.add_part(bad_name, io.BytesIO(b"dup"), rows=1)
+        raise AssertionError(f"Duplicate name {bad_name} should be rejected")
+    except ValueError:
+        pass
+
+zip_path = bundler.close()
+assert zip_path == bundler.path
+
+with zipfile.ZipFile(zip_path) as zf:
+    names = zf.namelist()
+    manifest = json.loads(zf.read(MANIFEST_NAME))
+    contents = {name: zf.read(name) for name in names if name != MANIFEST_NAME}
+    compress_types = {info.compress_type for info in zf.infolist()}
+
+print(f"Entries: {names}")
+assert names == ["trade_data_part_1.xlsx", "trade_data_part_2.xlsx", MANIFEST_NAME]
+assert compress_types == {zipfile.ZIP_DEFLATED}
+assert manifest['total_rows'] == 1500
+for part in manifest['parts']:
+    data = contents[part['name']]
+    assert part['bytes'] == len(data)
+    assert part['sha256'] == hashlib.sha256(data).hexdigest()
+assert [p['rows'] for p in manifest['parts']] == [1000, 500]
+assert os.path.getsize(zip_path) < len(part_1) + len(part_2)
+
+# 3. Test close() is idempotent and add_part after close raises
+assert bundler.close() == zip_path
+try:
+    bundler.add_part("late.xlsx", io.BytesIO(b"late"), rows=1)
+    raise AssertionError("add_part after close should fail")
+except RuntimeError:
+    pass
+
+# 4. Test the bundle file is opened exclusively (never overwrites an existing file)
+try:
+    ExportBundler(config, file_name=os.path.basename(zip_path))
+    raise AssertionError("Existing bundle should not be overwritten")
+except FileExistsError:
+    pass
+
+# 5. Test default names are unique per run
+with ExportBundler(config) as first, ExportBundler(config) as second:
+    assert first.path != second.path
+
+# 6. Test pruning removes only .zip files older than the cutoff
+prune_dir = tempfile.mkdtemp()
+old_time = time.time() - 48 * 3600
+for name in ("old.zip", "new.zip", "old.txt"):
+    with open(os.path.join(prune_dir, name), "wb") as f:
+        f.write(b"x")
+for name in ("old.zip", "old.txt"):
+    os.utime(os.path.join(prune_dir, name), (old_time, old_time))
+
+assert prune_old_bundles(prune_dir, 0) == 0
+removed = prune_old_bundles(prune_dir, 24)
+print(f"Pruned: {removed}, left: {sorted(os.listdir(prune_dir))}")
+assert removed == 1
+assert sorted(os.listdir(prune_dir)) == ["new.zip", "old.txt"]
+
+print("\nAll exporter tests passed!")
@@ -0,0 +1,105 @@
+import io
+import time
+import threading
+from src.pipeline import CrawlPipeline
+
+
+class StubCrawler:
+    """Yields `pages` pages of `page_size` rows, or pages forever if pages is None."""
+
+    def __init__(self, pages=None, page_size=2, delay_after_first=0):
+        self.pages = pages
+        self.page_size = page_size
+        self.delay_after_first = delay_after_first
+
+    def fetch_data_fanout(self, start_date, end_date, company_name="", hs_code="", stop_event=None):
+        page = 0
+        while self.pages is None or page < self.pages:
+            if page == 1 and self.delay_after_first:
+                # Simulates a request that is stuck and ignores stop_event
+                time.sleep(self.delay_after_first)
+            page += 1
+            yield [{'id': f"{page}-{i}"} for i in range(self.page_size)]
+
+
+class StubProcessor:
+    def __init__(self, fail_on_write=False):
+        self.fail_on_write = fail_on_write
+
+    def clean_dataframe(self, df):
+        return df
+
+    def write_excel_bytes(self, df_clean):
+        if self.fail_on_write:
+            raise ValueError("disk full")
+        return io.BytesIO(b"xlsx")
+
+
+class StubBundler:
+    def __init__(self):
+        self.parts = []
+
+    def add_part(self, name, fileobj, rows):
+        self.parts.append({'name': name, 'rows': rows})
+
+
+def make_pipeline(crawler, processor=None, max_rows=5, join_timeout=5):
+    config = {'processing': {'max_rows_per_file': max_rows}, 'pipeline': {'queue_size': 2, 'join_timeout': join_timeout}}
+    bundler = StubBundler()
+    return CrawlPipeline(config, crawler, processor or StubProcessor(), bundler), bundler
+
+
+def pipeline_threads():
+    return [t for t in threading.enumerate() if t.name.startswith("pipeline-")]
+
+
+# 1. Test parts are split at max_rows_per_file (7 pages x 2 rows = 14 rows -> 5 + 5 + 4)
+pipeline, bundler = make_pipeline(StubCrawler(pages=7))
+events = list(pipeline.run("2026-01-01", "2026-01-31"))
+print(f"Parts: {bundler.parts}")
+assert [p['rows'] for p in bundler.parts] == [5, 5, 4]
+assert [p['name'] for p in bundler.parts] == [f"trade_data_part_{i}.xlsx" for i in (1, 2, 3)]
+assert events[-1]['stage'] == 'write'
+
+# 2. Test a second run on the same instance is rejected
+try:
+    list(pipeline.run("2026-01-01", "2026-01-31"))
+    raise AssertionError("Second run should fail")
+except RuntimeError:
+    pass
+
+# 3. Test a stage error is re-raised to the caller
+pipeline, bundler = make_pipeline(StubCrawler(pages=7), StubProcessor(fail_on_write=True))
+try:
+    list(pipeline.run("2026-01-01", "2026-01-31"))
+    raise AssertionError("Stage error should be re-raised")
+except ValueError as e:
+    print(f"Re-raised: {e}")
+assert not bundler.parts
+
+# 4. Test a stage error reaches the caller without waiting for a stuck crawler
+crawler = StubCrawler(pages=None, page_size=5, delay_after_first=8)
+pipeline, bundler = make_pipeline(crawler, StubProcessor(fail_on_write=True), join_timeout=1)
+started = time.monotonic()
+try:
+    list(pipeline.run("2026-01-01", "2026-01-31"))
+    raise AssertionError("Stage error should be re-raised")
+except ValueError:
+    pass
+elapsed = time.monotonic() - started
+print(f"Writer error raised after {elapsed:.2f}s (crawler stuck for 8s)")
+assert elapsed < 3
+
+# 5. Test close() stops all stages (crawler never ends on its own).
+# The stuck crawler from test 4 may still be sleeping, so only this pipeline's threads are checked.
+threads_before = set(pipeline_threads())
+pipeline, bundler = make_pipeline(StubCrawler(pages=None))
+run_gen = pipeline.run("2026-01-01", "2026-01-31")
+next(run_gen)
+started = time.monotonic()
+run_gen.close()
+leftover_threads = set(pipeline_threads()) - threads_before
+print(f"Stopped in {time.monotonic() - started:.2f}s, alive threads: {len(leftover_threads)}")
+assert not leftover_threads
+
+print("\nAll pipeline tests passed!")
@@ -0,0 +1,89 @@
+import gc
+import os
+import time
+import tempfile
+import threading
+from session_store import LogBuffer, DatasetRegistry
+
+# 1. Test LogBuffer keeps only the newest entries
+logs = LogBuffer(max_entries=5)
+for i in range(12):
+    logs.append(f"event {i}")
+print(f"Kept entries: {len(logs)}")
+assert len(logs) == 5
+
+# 2. Test paging (newest first, last page may be partial)
+assert logs.page_count(2) == 3
+page_1 = logs.page(1, 2)
+print(f"Page 1: {page_1}")
+assert [line.split("] ")[1] for line in page_1] == ["event 11", "event 10"]
+assert [line.split("] ")[1] for line in logs.page(3, 2)] == ["event 7"]
+assert logs.page(4, 2) == []
+
+# 3. Test clear and empty paging
+logs.clear()
+assert len(logs) == 0
+assert logs.page_count(50) == 1
+assert logs.page(1, 50) == []
+
+# 4. Test DatasetRegistry shares one DataFrame per file content
+reads = []
+
+def fake_reader(buffer):
+    reads.append(1)
+    return ["row"] * 3
+
+tmp_dir = tempfile.mkdtemp()
+path_a = os.path.join(tmp_dir, "a.xls")
+path_b = os.path.join(tmp_dir, "b.xls")
+for path in (path_a, path_b):
+    with open(path, "wb") as f:
+        f.write(b"same content")
+
+registry = DatasetRegistry()
+lease_1 = registry.acquire_file(path_a, reader=fake_reader)
+lease_2 = registry.acquire_file(path_b, reader=fake_reader)
+print(f"Datasets: {len(registry)}, parsed: {len(reads)}")
+assert len(registry) == 1
+assert len(reads) == 1
+assert lease_1.data is lease_2.data
+
+# 5. Test reference counting (release is idempotent, GC releases too)
+lease_1.release()
+lease_1.release()
+assert len(registry) == 1
+del lease_2
+gc.collect()
+assert len(registry) == 0
+
+# 6. Test a slow parse does not block other sessions reading their datasets
+parse_started = threading.Event()
+finish_parse = threading.Event()
+
+def slow_reader(buffer):
+    parse_started.set()
+    finish_parse.wait(5)
+    return ["slow row"]
+
+path_slow = os.path.join(tmp_dir, "slow.xls")
+with open(path_slow, "wb") as f:
+    f.write(b"other content")
+
+lease_fast = registry.acquire_file(path_a, reader=fake_reader)
+leases = []
+loader = threading.Thread(target=lambda: leases.append(registry.acquire_file(path_slow, reader=slow_reader)))
+loader.start()
+assert parse_started.wait(5)
+
+started = time.monotonic()
+assert lease_fast.data == ["row"] * 3
+elapsed = time.monotonic() - started
+print(f"Read during slow parse took {elapsed:.3f}s")
+assert elapsed < 0.5
+
+finish_parse.set()
+loader.join(5)
+assert leases[0].data == ["slow row"]
+assert len(registry) == 2
+
+print("\nAll session store tests passed!")